@@ -1,4 +1,3 @@
-import torch
 import comfy.utils
 import folder_paths
 import os
@@ -97,18 +96,25 @@ class CombineLoras:
     
     def _fallback_linear_merge(self, lora1, lora2, strength1, strength2):
         """Fallback linear merge method (original implementation)"""
+        # A zero-strength LoRA only contributes zeros; skip reading its tensors entirely
+        if strength1 == 0:
+            lora1 = {}
+        elif strength2 == 0:
+            lora2 = {}
+        
         merged = {}
-        all_keys = set(lora1.keys()) | set(lora2.keys())
         
-        for key in all_keys:
-            val1 = lora1.get(key, torch.zeros_like(lora2[key]) if key in lora2 else None)
-            val2 = lora2.get(key, torch.zeros_like(lora1[key]) if key in lora1 else None)
-            
-            if val1 is not None and val2 is not None:
-                merged[key] = strength1 * val1 + strength2 * val2
-            elif val1 is not None:
+        # Walk each dict once; keys missing from one LoRA are scaled directly instead of adding a zero tensor
+        for key, val1 in lora1.items():
+            val2 = lora2.get(key)
+            if val2 is not None:
+                # Out-of-place add so mismatched shapes still broadcast like the original expression
+                merged[key] = val1.mul(strength1).add(val2, alpha=strength2)
+            else:
                 merged[key] = strength1 * val1
-            elif val2 is not None:
+        
+        for key, val2 in lora2.items():
+            if key not in lora1:
                 merged[key] = strength2 * val2
 
         return merged
@@ -1,103 +1,122 @@
+import os
+from itertools import islice
+
 import torch
 from safetensors import safe_open
 
 
+# (lora_path1, lora_path2) -> ((mtime1, mtime2), result); an mtime change invalidates the entry
+_COMPAT_CACHE = {}
+
+
 def check_lora_compatibility(lora_path1, lora_path2):
     """
     Check if two LoRAs are compatible for merging.
+    Results are cached per pair of files until either file's mtime changes.
     
     Returns:
         tuple: (is_compatible, compatibility_info, lora_type)
     """
     try:
-        with safe_open(lora_path1, framework="pt", device="cpu") as f1:
+        cache_key = (lora_path1, lora_path2)
+        mtimes = (os.stat(lora_path1).st_mtime_ns, os.stat(lora_path2).st_mtime_ns)
+        cached = _COMPAT_CACHE.get(cache_key)
+        if cached is not None and cached[0] == mtimes:
+            return cached[1]
+        
+        with safe_open(lora_path1, framework="pt", device="cpu") as f1, \
+             safe_open(lora_path2, framework="pt", device="cpu") as f2:
             keys1 = set(f1.keys())
-            
-        with safe_open(lora_path2, framework="pt", device="cpu") as f2:
             keys2 = set(f2.keys())
-        
-        # Detect LoRA type based on key patterns
-        lora_type1 = detect_lora_type(keys1)
-        lora_type2 = detect_lora_type(keys2)
-        
-        compatibility_info = {
-            "lora1_type": lora_type1,
-            "lora2_type": lora_type2,
-            "common_keys": len(keys1 & keys2),
-            "unique_keys1": len(keys1 - keys2),
-            "unique_keys2": len(keys2 - keys1),
-            "total_keys1": len(keys1),
-            "total_keys2": len(keys2)
-        }
-        
-        # Check basic compatibility
-        is_compatible = True
-        issues = []
-        
-        # Type compatibility check
-        if lora_type1 != lora_type2:
-            issues.append(f"LoRA types don't match: {lora_type1} vs {lora_type2}")
-            is_compatible = False
-        
-        # Check for some common keys (they should share at least some structure)
-        if len(keys1 & keys2) == 0:
-            issues.append("No common keys found between LoRAs")
-            is_compatible = False
-        
-        # Check for dimension compatibility on common keys
-        if is_compatible:
-            dim_issues = check_dimension_compatibility(lora_path1, lora_path2, keys1 & keys2)
-            if dim_issues:
-                issues.extend(dim_issues)
+            
+            # Detect LoRA type based on key patterns
+            lora_type1 = detect_lora_type(keys1)
+            lora_type2 = detect_lora_type(keys2)
+            
+            compatibility_info = {
+                "lora1_type": lora_type1,
+                "lora2_type": lora_type2,
+                "common_keys": len(keys1 & keys2),
+                "unique_keys1": len(keys1 - keys2),
+                "unique_keys2": len(keys2 - keys1),
+                "total_keys1": len(keys1),
+                "total_keys2": len(keys2)
+            }
+            
+            # Check basic compatibility
+            is_compatible = True
+            issues = []
+            
+            # Type compatibility check
+            if lora_type1 != lora_type2:
+                issues.append(f"LoRA types don't match: {lora_type1} vs {lora_type2}")
+                is_compatible = False
+            
+            # Check for some common keys (they should share at least some structure)
+            if len(keys1 & keys2) == 0:
+                issues.append("No common keys found between LoRAs")
                 is_compatible = False
+            
+            # Check for dimension compatibility on common keys, reusing the open handles
+            if is_compatible:
+                dim_issues = check_dimension_compatibility(f1, f2, keys1 & keys2)
+                if dim_issues:
+                    issues.extend(dim_issues)
+                    is_compatible = False
         
         compatibility_info["issues"] = issues
         compatibility_info["is_compatible"] = is_compatible
         
-        return is_compatible, compatibility_info, lora_type1
+        result = (is_compatible, compatibility_info, lora_type1)
+        _COMPAT_CACHE[cache_key] = (mtimes, result)
+        return result
         
     except Exception as e:
         return False, {"error": str(e)}, "unknown"
 
 
+# Key substrings identifying each LoRA type, in detection priority order
+_LORA_TYPE_MARKERS = (
+    ("standard_lora", (".lora_down.weight",)),
+    ("peft_lora", (".lora_A", ".lora_B")),
+    ("transformer_lora", ("q_proj", "k_proj", "v_proj")),
+    ("generic_weights", (".weight",)),
+)
+
+
 def detect_lora_type(keys):
     """
     Detect the type of LoRA based on key patterns.
     """
-    key_list = list(keys)
+    # Join once so each check is a single native substring search over all keys
+    joined = "\n".join(keys)
+    for lora_type, markers in _LORA_TYPE_MARKERS:
+        if any(marker in joined for marker in markers):
+            return lora_type
     
-    # Check for standard LoRA patterns
-    if any(".lora_down.weight" in key for key in key_list):
-        return "standard_lora"
-    elif any(".lora_A" in key or ".lora_B" in key for key in key_list):
-        return "peft_lora"
-    elif any("q_proj" in key or "k_proj" in key or "v_proj" in key for key in key_list):
-        return "transformer_lora"
-    elif any(".weight" in key for key in key_list):
-        return "generic_weights"
-    else:
-        return "unknown"
+    return "unknown"
 
 
-def check_dimension_compatibility(lora_path1, lora_path2, common_keys):
+def check_dimension_compatibility(f1, f2, common_keys):
     """
     Check if dimensions of common keys are compatible.
+    
+    Args:
+        f1, f2: Open safetensors handles for the two LoRAs
+        common_keys: Keys present in both files
     """
     issues = []
-    sample_keys = list(common_keys)[:5]  # Check first 5 common keys
+    sample_keys = islice(common_keys, 5)  # Check first 5 common keys
     
     try:
-        with safe_open(lora_path1, framework="pt", device="cpu") as f1, \
-             safe_open(lora_path2, framework="pt", device="cpu") as f2:
+        for key in sample_keys:
+            # Shapes come from the safetensors header; tensor data is never read
+            shape1 = f1.get_slice(key).get_shape()
+            shape2 = f2.get_slice(key).get_shape()
             
-            for key in sample_keys:
-                if key in f1.keys() and key in f2.keys():
-                    tensor1 = f1.get_tensor(key)
-                    tensor2 = f2.get_tensor(key)
-                    
-                    if tensor1.shape != tensor2.shape:
-                        issues.append(f"Dimension mismatch for '{key}': {tensor1.shape} vs {tensor2.shape}")
-                        
+            if shape1 != shape2:
+                issues.append(f"Dimension mismatch for '{key}': {shape1} vs {shape2}")
+                
     except Exception as e:
         issues.append(f"Error checking dimensions: {str(e)}")
     
@@ -113,11 +132,10 @@ def get_lora_info(lora_path):
             keys = list(f.keys())
             lora_type = detect_lora_type(keys)
             
-            # Get some sample tensor info
+            # Get some sample tensor info (header only, no tensor data is read)
             sample_shapes = {}
             for key in keys[:3]:  # First 3 keys
-                tensor = f.get_tensor(key)
-                sample_shapes[key] = list(tensor.shape)
+                sample_shapes[key] = list(f.get_slice(key).get_shape())
             
             return {
                 "type": lora_type,
@@ -1,6 +1,10 @@
+from itertools import groupby
+
 import torch
 from safetensors import safe_open
-from safetensors.torch import save_file
+
+from lora_io import SafetensorsStreamWriter, prefetch_to_device
+from merge_methods import concat_scaled_factors
 
 
 """
@@ -22,74 +26,78 @@ device = "cuda" if torch.cuda.is_available() else "cpu"
 print(f"Using device: {device}")
 
 
+# Open every LoRA once and keep the handles alive for the whole merge
+recipe_handles = []
+for lora_path, weight in lora_recipes:
+    f = safe_open(lora_path, framework="pt", device="cpu")
+    recipe_handles.append((lora_path, weight, f, set(f.keys())))
+
 prefixes = set()
-for lora_path, _ in lora_recipes:
-    with safe_open(lora_path, framework="pt", device="cpu") as f:
-        for key in f.keys():
-            if key.endswith(".lora_down.weight"):
-                prefix = key[:-len(".lora_down.weight")]
-                prefixes.add(prefix)
+for _, _, _, keys in recipe_handles:
+    for key in keys:
+        if key.endswith(".lora_down.weight"):
+            prefix = key[:-len(".lora_down.weight")]
+            prefixes.add(prefix)
 
 print(f"Found {len(prefixes)} unique adapted modules to merge.")
 
 
-combined_state_dict = {}
-for prefix in sorted(prefixes):
-    A_list = []
-    B_list = []
-    new_r = 0
-    in_features = None
-    out_features = None
-    has_alpha = False
-
-    for lora_path, weight in lora_recipes:
-        with safe_open(lora_path, framework="pt", device="cpu") as f:
-            A_key = f"{prefix}.lora_down.weight"
-            B_key = f"{prefix}.lora_up.weight"
-            alpha_key = f"{prefix}.alpha"
-
-            if A_key in f.keys() and B_key in f.keys():
-                A = f.get_tensor(A_key).to(device)
-                B = f.get_tensor(B_key).to(device)
-                r_i = A.shape[0]
-                assert A.shape == (r_i, A.shape[1]), f"Unexpected A shape in {lora_path}"
-                assert B.shape == (B.shape[0], r_i), f"Unexpected B shape in {lora_path}"
-
-                if in_features is None:
-                    in_features = A.shape[1]
-                    out_features = B.shape[0]
-                else:
-                    assert in_features == A.shape[1], f"Dim mismatch in {lora_path}"
-                    assert out_features == B.shape[0], f"Dim mismatch in {lora_path}"
-
-                if alpha_key in f.keys():
-                    alpha = f.get_tensor(alpha_key).item()
-                    scaling = alpha / r_i
-                    has_alpha = True
-                else:
-                    scaling = 1.0
-
-                s = weight * scaling
-                if s == 0:
-                    continue
-                sqrt_s = torch.sqrt(torch.tensor(s)).to(device)
-
-                A = A * sqrt_s
-                B = B * sqrt_s
-
-                A_list.append(A)
-                B_list.append(B)
-                new_r += r_i
-
-    if new_r > 0:
-        combined_A = torch.cat(A_list, dim=0)
-        combined_B = torch.cat(B_list, dim=1)
-        combined_state_dict[f"{prefix}.lora_down.weight"] = combined_A.to("cpu")
-        combined_state_dict[f"{prefix}.lora_up.weight"] = combined_B.to("cpu")
-        if has_alpha:
-            combined_state_dict[f"{prefix}.alpha"] = torch.tensor(new_r)
-
-
-print(f"Saving new combined LoRA to {output_lora_path}...")
-save_file(combined_state_dict, output_lora_path)
+def load_recipe_tensors():
+    """Yield ((prefix, lora_path, weight, alpha), (A, B)) CPU tensors in prefix order."""
+    for prefix in sorted(prefixes):
+        A_key = f"{prefix}.lora_down.weight"
+        B_key = f"{prefix}.lora_up.weight"
+        alpha_key = f"{prefix}.alpha"
+
+        for lora_path, weight, f, keys in recipe_handles:
+            if A_key in keys and B_key in keys:
+                alpha = f.get_tensor(alpha_key).item() if alpha_key in keys else None
+                yield (prefix, lora_path, weight, alpha), (f.get_tensor(A_key), f.get_tensor(B_key))
+
+
+# Each prefix is written as soon as it is merged, so only one prefix is resident at a time
+print(f"Streaming new combined LoRA to {output_lora_path}...")
+with SafetensorsStreamWriter(output_lora_path) as writer:
+    recipe_stream = prefetch_to_device(load_recipe_tensors(), device)
+    for prefix, group in groupby(recipe_stream, key=lambda item: item[0][0]):
+        factors = []
+        new_r = 0
+        in_features = None
+        out_features = None
+        has_alpha = False
+
+        for (_, lora_path, weight, alpha), (A, B) in group:
+            r_i = A.shape[0]
+            assert A.shape == (r_i, A.shape[1]), f"Unexpected A shape in {lora_path}"
+            assert B.shape == (B.shape[0], r_i), f"Unexpected B shape in {lora_path}"
+
+            if in_features is None:
+                in_features = A.shape[1]
+                out_features = B.shape[0]
+            else:
+                assert in_features == A.shape[1], f"Dim mismatch in {lora_path}"
+                assert out_features == B.shape[0], f"Dim mismatch in {lora_path}"
+
+            if alpha is not None:
+                scaling = alpha / r_i
+                has_alpha = True
+            else:
+                scaling = 1.0
+
+            s = weight * scaling
+            if s == 0:
+                continue
+
+            factors.append((A, B, s))
+            new_r += r_i
+
+        if new_r > 0:
+            # Scale each recipe straight into its slice of pre-sized buffers instead of cat-ing temporaries
+            combined_A, combined_B = concat_scaled_factors(factors, new_r, in_features, out_features)
+            writer.add(f"{prefix}.lora_down.weight", combined_A)
+            writer.add(f"{prefix}.lora_up.weight", combined_B)
+            if has_alpha:
+                writer.add(f"{prefix}.alpha", torch.tensor(float(new_r), dtype=torch.float32))
+
+
 print("Done! You now have a single, combined LoRA")
\ No newline at end of file
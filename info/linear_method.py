@@ -1,6 +1,9 @@
+from itertools import groupby
+
 import torch
 from safetensors import safe_open
-from safetensors.torch import save_file
+
+from lora_io import SafetensorsStreamWriter, prefetch_to_device
 
 
 """
@@ -20,24 +23,37 @@ output_lora_path = "/ComfyUI/models/loras/Qwen/NSFW_Meta-B4.safetensors"
 device = "cuda" if torch.cuda.is_available() else "cpu"
 print(f"Using device: {device}")
 
+# Open every LoRA once and keep the handles alive for the whole merge
+recipe_handles = []
 keys = set()
-for lora_path, _ in lora_recipes:
-    with safe_open(lora_path, framework="pt", device="cpu") as f:
-        keys.update(f.keys())
+for lora_path, weight in lora_recipes:
+    f = safe_open(lora_path, framework="pt", device="cpu")
+    recipe_keys = set(f.keys())
+    recipe_handles.append((lora_path, weight, f, recipe_keys))
+    keys.update(recipe_keys)
 
 print(f"Found {len(keys)} unique keys to merge.")
 
-combined_state_dict = {}
-for lora_path, weight in lora_recipes:
-    print(f"Adding {lora_path} with weight {weight}...")
-    with safe_open(lora_path, framework="pt", device="cpu") as f:
-        for key in f.keys():
-            tensor = f.get_tensor(key).to(device)
-            if key in combined_state_dict:
-                combined_state_dict[key] += weight * tensor
+
+def load_recipe_tensors():
+    """Yield ((key, weight), (tensor,)) CPU tensors, grouped by key."""
+    for key in sorted(keys):
+        for lora_path, weight, f, recipe_keys in recipe_handles:
+            if key in recipe_keys:
+                yield (key, weight), (f.get_tensor(key),)
+
+
+# Each key is summed across all recipes and written immediately, so only one key is resident at a time
+print(f"Streaming new combined LoRA to {output_lora_path}...")
+with SafetensorsStreamWriter(output_lora_path) as writer:
+    recipe_stream = prefetch_to_device(load_recipe_tensors(), device)
+    for key, group in groupby(recipe_stream, key=lambda item: item[0][0]):
+        combined = None
+        for (_, weight), (tensor,) in group:
+            if combined is None:
+                combined = weight * tensor
             else:
-                combined_state_dict[key] = weight * tensor
+                combined += weight * tensor
+        writer.add(key, combined)
 
-print(f"Saving new combined LoRA to {output_lora_path}...")
-save_file({k: v.to("cpu") for k, v in combined_state_dict.items()}, output_lora_path)
-print("Done! You now have a single linear merged LoRA.")
\ No newline at end of file
+print("Done! You now have a single linear merged LoRA.")
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import struct
+import tempfile
+
+import torch
+
+
+def prefetch_to_device(items, device):
+    """
+    Copy tensors to a device one item ahead of the consumer.
+
+    On CUDA the host-to-device copy of the next item is issued on a dedicated
+    copy stream from pinned memory, so disk reads and PCIe transfers overlap
+    with whatever the caller is computing on the current item.
+
+    Args:
+        items: Iterable of (tag, tensors) where tensors is a tuple of CPU tensors
+        device: Target device
+
+    Yields:
+        tuple: (tag, tensors) with tensors resident on the target device
+    """
+    device = torch.device(device)
+    if device.type != "cuda":
+        for tag, tensors in items:
+            yield tag, tuple(t.to(device) for t in tensors)
+        return
+
+    copy_stream = torch.cuda.Stream(device=device)
+    compute_stream = torch.cuda.current_stream(device)
+
+    def issue(tensors):
+        pinned = [t.pin_memory() for t in tensors]
+        with torch.cuda.stream(copy_stream):
+            copies = tuple(t.to(device, non_blocking=True) for t in pinned)
+            ready = torch.cuda.Event()
+            ready.record(copy_stream)
+        return copies, ready
+
+    def finish(copies, ready):
+        compute_stream.wait_event(ready)
+        for t in copies:
+            # Allocated on the copy stream, consumed on the compute stream
+            t.record_stream(compute_stream)
+        return copies
+
+    pending = None
+    for tag, tensors in items:
+        issued = (tag, issue(tensors))
+        if pending is not None:
+            yield pending[0], finish(*pending[1])
+        pending = issued
+
+    if pending is not None:
+        yield pending[0], finish(*pending[1])
+
+
+_SAFETENSORS_DTYPES = {
+    torch.float64: "F64",
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.int16: "I16",
+    torch.int8: "I8",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+}
+for _name, _code in [("float8_e4m3fn", "F8_E4M3"), ("float8_e5m2", "F8_E5M2")]:
+    if hasattr(torch, _name):
+        _SAFETENSORS_DTYPES[getattr(torch, _name)] = _code
+
+
+class SafetensorsStreamWriter:
+    """
+    Write a safetensors file one tensor at a time.
+
+    Tensor bytes are spooled to a temporary file as they are added, so only the
+    tensor currently being written has to be resident in memory. The header is
+    written and the data appended when the writer is closed; if the context
+    exits with an exception no output file is produced.
+    """
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = metadata
+        self._header = {}
+        self._offset = 0
+        self._data = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+
+    def add(self, name, tensor):
+        """
+        Append a tensor to the file under the given key.
+        The tensor must be contiguous, so writing it never makes a hidden copy.
+        """
+        if name in self._header:
+            raise ValueError(f"Duplicate tensor name: {name}")
+        if tensor.dtype not in _SAFETENSORS_DTYPES:
+            raise ValueError(f"Unsupported dtype for safetensors: {tensor.dtype}")
+        if not tensor.is_contiguous():
+            raise ValueError(f"Tensor '{name}' is not contiguous")
+
+        tensor = tensor.detach().to("cpu")
+        data = tensor.reshape(-1).view(torch.uint8).numpy()
+        self._data.write(memoryview(data))
+
+        end = self._offset + data.nbytes
+        self._header[name] = {
+            "dtype": _SAFETENSORS_DTYPES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [self._offset, end],
+        }
+        self._offset = end
+
+    def close(self):
+        """
+        Write the header followed by the spooled tensor data.
+        """
+        header = dict(self._header)
+        if self.metadata:
+            header["__metadata__"] = self.metadata
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        # Pad the header so the data section starts 8-byte aligned
+        header_bytes += b" " * (-len(header_bytes) % 8)
+
+        with open(self.path, "wb") as out:
+            out.write(struct.pack("<Q", len(header_bytes)))
+            out.write(header_bytes)
+            self._data.seek(0)
+            shutil.copyfileobj(self._data, out)
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._data.close()
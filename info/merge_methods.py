@@ -1,11 +1,33 @@
+import math
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, reduce
+
 import torch
 from safetensors import safe_open
 
+try:
+    import comfy.model_management as model_management
+except ImportError:
+    model_management = None
+
+
+# Leave headroom for ATen's own intra-op threads on large tensors
+_MERGE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# Maximum number of same-shaped keys merged by one multi-tensor op on CPU
+_BUCKET_SIZE = 64
+# Upper bound on source tensor bytes moved to the GPU at once by the linear merge
+_GPU_CHUNK_BYTES = 256 * 1024 * 1024
+
 
 def linear_merge_method(lora_dict1, lora_dict2, strength1, strength2):
     """
     Linear merging method: directly adds weighted tensors together.
-    This is the simplest and fastest method.
+    This is the simplest and fastest method. Arithmetic runs on ComfyUI's
+    CUDA device when available, batched over bounded chunks of keys with
+    multi-tensor (foreach) kernels, otherwise keys are merged in parallel on
+    a CPU thread pool.
     
     Args:
         lora_dict1, lora_dict2: Loaded LoRA dictionaries
@@ -14,38 +36,233 @@ def linear_merge_method(lora_dict1, lora_dict2, strength1, strength2):
     Returns:
         dict: Merged LoRA dictionary
     """
+    # A zero-strength LoRA only contributes zeros; skip reading its tensors entirely
+    if strength1 == 0:
+        lora_dict1 = {}
+    elif strength2 == 0:
+        lora_dict2 = {}
+    
+    keys = list(lora_dict1) + [key for key in lora_dict2 if key not in lora_dict1]
+    
+    device = _merge_device()
+    if device.type == "cuda":
+        return _linear_merge_foreach(lora_dict1, lora_dict2, strength1, strength2, keys, device)
+    
+    return _linear_merge_threaded(lora_dict1, lora_dict2, strength1, strength2, keys)
+
+
+def _linear_merge_foreach(lora_dict1, lora_dict2, strength1, strength2, keys, device):
+    """
+    Linear merge on CUDA using multi-tensor (foreach) kernels.
+    Keys are processed in chunks of at most _GPU_CHUNK_BYTES of source tensors,
+    so the whole LoRA pair is never resident on the GPU next to the model.
+    """
     merged = {}
-    all_keys = set(lora_dict1.keys()) | set(lora_dict2.keys())
+    for chunk in _chunk_keys(keys, lora_dict1, lora_dict2, _GPU_CHUNK_BYTES):
+        merged.update(_merge_chunk_on_device(chunk, lora_dict1, lora_dict2, strength1, strength2, device))
+        # Chunks are serialized so only one chunk's tensors are resident on the GPU
+        torch.cuda.synchronize(device)
     
-    for key in all_keys:
-        val1 = lora_dict1.get(key, None)
-        val2 = lora_dict2.get(key, None)
-        
-        if val1 is not None and val2 is not None:
-            # Both LoRAs have this key
-            if val1.shape != val2.shape:
-                # Handle shape mismatch by zero-padding smaller tensor
-                max_shape = [max(s1, s2) for s1, s2 in zip(val1.shape, val2.shape)]
-                if list(val1.shape) != max_shape:
-                    padded_val1 = torch.zeros(max_shape, dtype=val1.dtype, device=val1.device)
-                    padded_val1[tuple(slice(0, s) for s in val1.shape)] = val1
-                    val1 = padded_val1
-                if list(val2.shape) != max_shape:
-                    padded_val2 = torch.zeros(max_shape, dtype=val2.dtype, device=val2.device)
-                    padded_val2[tuple(slice(0, s) for s in val2.shape)] = val2
-                    val2 = padded_val2
-            
-            merged[key] = strength1 * val1 + strength2 * val2
-        elif val1 is not None:
-            # Only first LoRA has this key
-            merged[key] = strength1 * val1
-        elif val2 is not None:
-            # Only second LoRA has this key
-            merged[key] = strength2 * val2
+    return merged
+
+
+def _chunk_keys(keys, lora_dict1, lora_dict2, max_bytes):
+    """
+    Split keys into consecutive chunks whose source tensors total at most max_bytes.
+    A single key larger than max_bytes gets a chunk of its own.
+    """
+    chunk = []
+    chunk_bytes = 0
+    for key in keys:
+        key_bytes = sum(
+            val.numel() * val.element_size()
+            for val in (lora_dict1.get(key), lora_dict2.get(key))
+            if val is not None
+        )
+        if chunk and chunk_bytes + key_bytes > max_bytes:
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(key)
+        chunk_bytes += key_bytes
+    
+    if chunk:
+        yield chunk
+
+
+def _merge_chunk_on_device(keys, lora_dict1, lora_dict2, strength1, strength2, device):
+    """
+    Merge one chunk of keys on the device with a handful of foreach kernels.
+    """
+    merged = {}
+    both = [key for key in keys if key in lora_dict1 and key in lora_dict2]
+    only1 = [key for key in keys if key in lora_dict1 and key not in lora_dict2]
+    only2 = [key for key in keys if key not in lora_dict1]
+    
+    # Both LoRAs have these keys
+    vals1 = []
+    vals2 = []
+    for key in both:
+        val1, val2 = _pad_to_common_shape(lora_dict1[key], lora_dict2[key])
+        # Same result dtype as the eager expression, independent of LoRA order
+        dtype = torch.promote_types(val1.dtype, val2.dtype)
+        vals1.append(val1.to(device, dtype=dtype, non_blocking=True))
+        vals2.append(val2.to(device, dtype=dtype, non_blocking=True))
+    
+    # Multi-tensor kernels: a handful of launches instead of several per key
+    if both:
+        merged_vals = torch._foreach_mul(vals1, strength1)
+        torch._foreach_add_(merged_vals, vals2, alpha=strength2)
+    else:
+        merged_vals = []
+    
+    # Keys present in only one of the LoRAs
+    only_vals1 = [lora_dict1[key].to(device, non_blocking=True) for key in only1]
+    only_vals2 = [lora_dict2[key].to(device, non_blocking=True) for key in only2]
+    only_merged1 = torch._foreach_mul(only_vals1, strength1) if only1 else []
+    only_merged2 = torch._foreach_mul(only_vals2, strength2) if only2 else []
+    
+    # Move results back next to the source tensors
+    for group, results, source in [
+        (both, merged_vals, lora_dict1),
+        (only1, only_merged1, lora_dict1),
+        (only2, only_merged2, lora_dict2),
+    ]:
+        for key, result in zip(group, results):
+            # Blocking copy: a non-blocking device-to-host copy would land in pinned memory
+            merged[key] = result.to(source[key].device)
     
     return merged
 
 
+def _linear_merge_threaded(lora_dict1, lora_dict2, strength1, strength2, keys):
+    """
+    Linear merge on CPU, spreading the independent buckets over a thread pool.
+    ATen releases the GIL inside its kernels, so the buckets are processed in parallel.
+    """
+    merge_bucket = partial(_merge_bucket, lora_dict1=lora_dict1, lora_dict2=lora_dict2,
+                           strength1=strength1, strength2=strength2)
+    merged = {}
+    with ThreadPoolExecutor(max_workers=_MERGE_WORKERS) as executor:
+        for bucket, results in executor.map(merge_bucket, _bucket_keys(keys, lora_dict1, lora_dict2)):
+            merged.update(zip(bucket, results))
+    
+    return merged
+
+
+def _bucket_keys(keys, lora_dict1, lora_dict2):
+    """
+    Group keys whose tensors share presence, shape and dtype in both LoRAs.
+    
+    Many LoRA modules have identical shapes (e.g. every attention projection),
+    so each bucket can be merged with one multi-tensor op instead of one op per
+    key. Buckets are split into chunks of _BUCKET_SIZE to keep the pool balanced.
+    """
+    buckets = defaultdict(list)
+    for key in keys:
+        signature = tuple(
+            (val.shape, val.dtype) if val is not None else None
+            for val in (lora_dict1.get(key), lora_dict2.get(key))
+        )
+        buckets[signature].append(key)
+    
+    return [
+        bucket[i:i + _BUCKET_SIZE]
+        for bucket in buckets.values()
+        for i in range(0, len(bucket), _BUCKET_SIZE)
+    ]
+
+
+def _merge_bucket(keys, lora_dict1, lora_dict2, strength1, strength2):
+    """
+    Linearly merge a bucket of keys with matching presence, shapes and dtypes.
+    """
+    first = keys[0]
+    if first in lora_dict1 and first in lora_dict2:
+        vals1 = []
+        vals2 = []
+        for key in keys:
+            val1, val2 = _pad_to_common_shape(lora_dict1[key], lora_dict2[key])
+            # Same result dtype as the eager expression, independent of LoRA order
+            dtype = torch.promote_types(val1.dtype, val2.dtype)
+            vals1.append(val1.to(dtype))
+            vals2.append(val2.to(dtype))
+        results = torch._foreach_mul(vals1, strength1)
+        torch._foreach_add_(results, vals2, alpha=strength2)
+    elif first in lora_dict1:
+        results = torch._foreach_mul([lora_dict1[key] for key in keys], strength1)
+    else:
+        results = torch._foreach_mul([lora_dict2[key] for key in keys], strength2)
+    
+    return keys, results
+
+
+def _merge_device():
+    """
+    Pick the device used for merge arithmetic, following ComfyUI's device choice when available.
+    """
+    if model_management is not None:
+        return model_management.get_torch_device()
+    return torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+
+
+def _weighted_sum(val1, val2, strength1, strength2):
+    """
+    Compute strength1 * val1 + strength2 * val2 with a single intermediate.
+    The add is out of place so broadcasting and dtype promotion still apply.
+    """
+    return val1.mul(strength1).add(val2, alpha=strength2)
+
+
+def concat_scaled_factors(factors, new_r, in_features, out_features):
+    """
+    Scale and concatenate (A, B, s) factors straight into pre-sized buffers.
+    
+    Each pair is scaled so that B @ A is multiplied by s: A by sign(s) * sqrt(|s|)
+    and B by sqrt(|s|). The sign goes on A only, otherwise it would cancel out.
+    Scales are Python floats, so no scalar tensor or host-to-device copy is made.
+    
+    A matrices are stacked along the rank dimension (rows) and B matrices along
+    the rank dimension (columns), writing each scaled slice in place rather than
+    scaling into temporaries and concatenating them afterwards. Both buffers are
+    contiguous, so saving them with safetensors needs no extra copy.
+    """
+    A0, B0, _ = factors[0]
+    A_dtype = reduce(torch.promote_types, (A.dtype for A, _, _ in factors))
+    B_dtype = reduce(torch.promote_types, (B.dtype for _, B, _ in factors))
+    combined_A = torch.empty((new_r, in_features), dtype=A_dtype, device=A0.device)
+    combined_B = torch.empty((out_features, new_r), dtype=B_dtype, device=B0.device)
+    
+    offset = 0
+    for A, B, s in factors:
+        r_i = A.shape[0]
+        sqrt_s = math.sqrt(abs(s))
+        torch.mul(A, math.copysign(sqrt_s, s), out=combined_A[offset:offset + r_i])
+        torch.mul(B, sqrt_s, out=combined_B[:, offset:offset + r_i])
+        offset += r_i
+    
+    return combined_A, combined_B
+
+
+def _pad_to_common_shape(val1, val2):
+    """
+    Zero-pad two tensors to their elementwise maximum shape if they differ.
+    """
+    if val1.shape == val2.shape:
+        return val1, val2
+    
+    max_shape = [max(s1, s2) for s1, s2 in zip(val1.shape, val2.shape)]
+    if list(val1.shape) != max_shape:
+        padded_val1 = torch.zeros(max_shape, dtype=val1.dtype, device=val1.device)
+        padded_val1[tuple(slice(0, s) for s in val1.shape)] = val1
+        val1 = padded_val1
+    if list(val2.shape) != max_shape:
+        padded_val2 = torch.zeros(max_shape, dtype=val2.dtype, device=val2.device)
+        padded_val2[tuple(slice(0, s) for s in val2.shape)] = val2
+        val2 = padded_val2
+    return val1, val2
+
+
 def concatenation_merge_method(lora_dict1, lora_dict2, strength1, strength2):
     """
     Concatenation merging method: concatenates LoRA down/up matrices.
@@ -74,8 +291,19 @@ def concatenation_merge_method(lora_dict1, lora_dict2, strength1, strength2):
         # Fallback to linear method if no LoRA structure found
         return linear_merge_method(lora_dict1, lora_dict2, strength1, strength2)
     
+    # Index lora_dict1 keys by module prefix (dot-bounded) for the per-prefix fallback
+    keys_by_prefix = defaultdict(list)
+    for key in lora_dict1.keys():
+        dot = key.find(".")
+        while dot != -1:
+            if key[:dot] in prefixes:
+                keys_by_prefix[key[:dot]].append(key)
+            dot = key.find(".", dot + 1)
+    
     merged = {}
     device = "cpu"  # Work on CPU to avoid memory issues
+    # Zero-weighted LoRAs never contribute factors, so drop them once up front
+    weighted_dicts = [(lora_dict, weight) for lora_dict, weight in [(lora_dict1, strength1), (lora_dict2, strength2)] if weight != 0]
     
     for prefix in sorted(prefixes):
         # Try different key patterns
@@ -92,17 +320,13 @@ def concatenation_merge_method(lora_dict1, lora_dict2, strength1, strength2):
             alpha_key = f"{prefix}{alpha_suffix}"
             
             # Collect matrices from both LoRAs
-            A_list = []
-            B_list = []
+            factors = []
             new_r = 0
             in_features = None
             out_features = None
             has_alpha = False
             
-            for lora_dict, weight in [(lora_dict1, strength1), (lora_dict2, strength2)]:
-                if weight == 0:
-                    continue
-                    
+            for lora_dict, weight in weighted_dicts:
                 if down_key in lora_dict and up_key in lora_dict:
                     A = lora_dict[down_key].to(device)
                     B = lora_dict[up_key].to(device)
@@ -134,58 +358,49 @@ def concatenation_merge_method(lora_dict1, lora_dict2, strength1, strength2):
                     if s == 0:
                         continue
                         
-                    sqrt_s = torch.sqrt(torch.abs(torch.tensor(s))).to(device)
-                    if s < 0:
-                        sqrt_s = -sqrt_s
-                    
-                    A = A * sqrt_s
-                    B = B * sqrt_s
-                    
-                    A_list.append(A)
-                    B_list.append(B)
+                    factors.append((A, B, s))
                     new_r += r_i
             
             # Merge if we found compatible matrices
-            if new_r > 0 and A_list and B_list:
-                combined_A = torch.cat(A_list, dim=0)
-                combined_B = torch.cat(B_list, dim=1)
+            if new_r > 0 and factors:
+                combined_A, combined_B = concat_scaled_factors(factors, new_r, in_features, out_features)
                 
                 merged[down_key] = combined_A
                 merged[up_key] = combined_B
                 
                 if has_alpha:
-                    merged[alpha_key] = torch.tensor(new_r, dtype=torch.float32)
+                    merged[alpha_key] = torch.tensor(float(new_r), dtype=torch.float32)
                 
                 merged_this_prefix = True
                 break
         
         # If concatenation failed, try linear merge for this prefix
         if not merged_this_prefix:
-            for key in lora_dict1.keys():
-                if key.startswith(prefix):
-                    val1 = lora_dict1.get(key)
-                    val2 = lora_dict2.get(key)
-                    
-                    if val1 is not None and val2 is not None:
-                        merged[key] = strength1 * val1 + strength2 * val2
-                    elif val1 is not None:
-                        merged[key] = strength1 * val1
-                    elif val2 is not None:
-                        merged[key] = strength2 * val2
-    
-    # Handle any remaining keys not covered by prefixes
-    all_keys = set(lora_dict1.keys()) | set(lora_dict2.keys())
-    for key in all_keys:
+            for key in keys_by_prefix[prefix]:
+                val1 = lora_dict1.get(key)
+                val2 = lora_dict2.get(key)
+                
+                if val1 is not None and val2 is not None:
+                    merged[key] = _weighted_sum(val1, val2, strength1, strength2)
+                elif val1 is not None:
+                    merged[key] = strength1 * val1
+                elif val2 is not None:
+                    merged[key] = strength2 * val2
+    
+    # Handle any remaining keys not covered by prefixes, walking each dict once
+    for key, val1 in lora_dict1.items():
         if key not in merged:
-            val1 = lora_dict1.get(key)
             val2 = lora_dict2.get(key)
             
-            if val1 is not None and val2 is not None:
-                merged[key] = strength1 * val1 + strength2 * val2
-            elif val1 is not None:
+            if val2 is not None:
+                merged[key] = _weighted_sum(val1, val2, strength1, strength2)
+            else:
                 merged[key] = strength1 * val1
-            elif val2 is not None:
-                merged[key] = strength2 * val2
+    
+    # Every lora_dict1 key is merged by now, so these exist only in lora_dict2
+    for key, val2 in lora_dict2.items():
+        if key not in merged:
+            merged[key] = strength2 * val2
     
     return merged
 